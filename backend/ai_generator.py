@@ -1,18 +1,92 @@
-import anthropic
-from typing import List, Optional, Dict, Any
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from functools import lru_cache
+from types import MappingProxyType
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Dict, Any
+
+# The SDK (and httpx/pydantic behind it) is imported on first client creation,
+# so importing this module stays cheap.
+if TYPE_CHECKING:
+    import anthropic
+
+
+@lru_cache(maxsize=None)
+def _http_client_class() -> type:
+    """The SDK's default httpx client, encoding JSON bodies with orjson when available"""
+    import anthropic
+
+    try:
+        import orjson
+    except ImportError:  # orjson is optional; fall back to httpx's stdlib json encoding
+        return anthropic.DefaultAsyncHttpxClient
+
+    class _OrjsonAsyncHttpxClient(anthropic.DefaultAsyncHttpxClient):
+        def build_request(self, *args, json=None, **kwargs):
+            if json is not None:
+                try:
+                    kwargs["content"] = orjson.dumps(json)
+                except TypeError:
+                    # Anything orjson can't encode goes through httpx's own encoder
+                    kwargs["json"] = json
+            return super().build_request(*args, **kwargs)
+
+    return _OrjsonAsyncHttpxClient
+
+
+@lru_cache(maxsize=4)
+def _get_client(api_key: str) -> "anthropic.AsyncAnthropic":
+    """Return the shared client for an API key so its connection pool is reused"""
+    import anthropic
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=AIGenerator.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=AIGenerator.HTTP_MAX_KEEPALIVE_CONNECTIONS
+    )
+    return anthropic.AsyncAnthropic(
+        api_key=api_key,
+        max_retries=2,
+        http_client=_http_client_class()(limits=limits)
+    )
+
 
 class AIGenerator:
     """Handles interactions with Anthropic's Claude API for generating responses"""
 
+    # Default cap on sequential tool rounds per query
     MAX_TOOL_ROUNDS = 2
 
+    # Upper bound on tool calls executing at once across all in-flight requests
+    MAX_CONCURRENT_TOOLS = 4
+
+    # Connection pool shared by all concurrent requests to the Anthropic API
+    HTTP_MAX_CONNECTIONS = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = 50
+
+    # Direct (tool-free) answers kept for verbatim repeats of the same query
+    RESPONSE_CACHE_SIZE = 1024
+
+    # Shared, read-only tool_choice sent with every call that offers tools
+    TOOL_CHOICE_AUTO = MappingProxyType({"type": "auto"})
+
+    # Conversation history is cut to its most recent characters beyond this size
+    MAX_HISTORY_CHARS = 4000
+
+    # Model context window, and the rough characters-per-token ratio used to
+    # estimate a request's size before sending it
+    MAX_CONTEXT_TOKENS = 200_000
+    CHARS_PER_TOKEN = 3.5
+    TRUNCATION_MARKER = "\n[truncated]"
+
     # Static system prompt to avoid rebuilding on each call
     SYSTEM_PROMPT = """ You are an AI assistant specialized in course materials and educational content with access to a comprehensive search tool for course information.
 
 Search Tool Usage:
 - Use `get_course_outline` for questions about course structure, lesson list, or course overview (e.g. "what lessons does X have?", "how many lessons are in X?", "what topics does X cover?")
 - Use `search_course_content` for questions about specific educational content within a course
-- **Up to 2 sequential tool calls per query** — use a second call only when the first result is insufficient to answer (e.g., get course outline first, then search for related content)
+- **Sequential tool calls per query are limited** — make another call only when the results so far are insufficient to answer (e.g., get course outline first, then search for related content)
 - Synthesize results into accurate, fact-based responses
 - If a tool yields no results, state this clearly without offering alternatives
 
@@ -31,10 +105,20 @@ All responses must be:
 4. **Example-supported** - Include relevant examples when they aid understanding
 Provide only the direct answer to what was asked.
 """
+
+    # Cache breakpoint on the static prompt; Anthropic caches tools + system up to here
+    SYSTEM_BLOCK = {
+        "type": "text",
+        "text": SYSTEM_PROMPT,
+        "cache_control": {"type": "ephemeral"}
+    }
     
     def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = _get_client(api_key)
         self.model = model
+        self._tool_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_TOOLS)
+        self._response_cache: OrderedDict[str, str] = OrderedDict()
+        self._tools_fingerprint = (None, b"null")  # (tools list, its serialized form)
         
         # Pre-build base API parameters
         self.base_params = {
@@ -42,11 +126,16 @@ Provide only the direct answer to what was asked.
             "temperature": 0,
             "max_tokens": 800
         }
+
+        # Complete parameters (minus messages) for a query with no tools or history
+        self._fast_params = {**self.base_params, "system": [self.SYSTEM_BLOCK]}
     
-    def generate_response(self, query: str,
-                         conversation_history: Optional[str] = None,
-                         tools: Optional[List] = None,
-                         tool_manager=None) -> str:
+    async def generate_response(self, query: str,
+                               conversation_history: Optional[str] = None,
+                               tools: Optional[List] = None,
+                               tool_manager=None,
+                               max_tool_rounds: Optional[int] = None,
+                               sources: Optional[list] = None) -> str:
         """
         Generate AI response with optional tool usage and conversation context.
         
@@ -55,104 +144,345 @@ Provide only the direct answer to what was asked.
             conversation_history: Previous messages for context
             tools: Available tools the AI can use
             tool_manager: Manager to execute tools
+            max_tool_rounds: Cap on sequential tool rounds, MAX_TOOL_ROUNDS if not given
+            sources: List that collects the sources of this query's tool calls
             
         Returns:
             Generated response as string
         """
+        if tools is None and tool_manager is None and conversation_history is None:
+            return await self._fast_path(query)
+
+        # Serve verbatim repeats from the in-process cache
+        cache_key = self._cache_key(query, conversation_history, tools)
+        cached = self._cached_response(cache_key)
+        if cached is not None:
+            return cached
+
+        api_params = self._build_params(query, conversation_history, tools)
         
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history 
-            else self.SYSTEM_PROMPT
-        )
+        # Get response from Claude
+        response = await self.client.messages.create(**api_params)
+        
+        # Handle tool execution if needed
+        if response.stop_reason == "tool_use" and tool_manager:
+            return await self._handle_tool_execution(
+                response, api_params, tool_manager,
+                self.MAX_TOOL_ROUNDS if max_tool_rounds is None else max_tool_rounds,
+                sources
+            )
         
-        # Prepare API call parameters efficiently
+        # Return direct response, caching it unless it was cut short by a tool request
+        text = self._response_text(response)
+        if response.stop_reason != "tool_use":
+            self._cache_response(cache_key, text)
+        return text
+
+    async def _fast_path(self, query: str) -> str:
+        """generate_response specialized for a bare query: no tools, no history"""
+        cache_key = self._cache_key(query, None, None)
+        cached = self._cached_response(cache_key)
+        if cached is not None:
+            return cached
+
+        # Without tools the response can't stop for tool use, so it is always final
+        response = await self.client.messages.create(
+            **self._fast_params, messages=[self._user_message(query)]
+        )
+        text = self._response_text(response)
+        self._cache_response(cache_key, text)
+        return text
+
+    async def generate_response_stream(self, query: str,
+                                      conversation_history: Optional[str] = None,
+                                      tools: Optional[List] = None,
+                                      tool_manager=None,
+                                      max_tool_rounds: Optional[int] = None,
+                                      sources: Optional[list] = None) -> AsyncIterator[Dict[str, str]]:
+        """
+        Stream an AI response as it is generated, running tool rounds as needed.
+
+        Text is yielded as it arrives. Text ahead of a tool call is only a
+        preamble, so once a round starts a tool call a reset event tells the
+        consumer to discard what that round has yielded so far; what is left at
+        the end is the answer generate_response would return.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            max_tool_rounds: Cap on sequential tool rounds, MAX_TOOL_ROUNDS if not given
+            sources: List that collects the sources of this query's tool calls
+
+        Yields:
+            {"type": "text", "text": ...} events in order, and a {"type": "reset"}
+            event ahead of each tool round whose preamble was yielded
+        """
+        cache_key = self._cache_key(query, conversation_history, tools)
+        cached = self._cached_response(cache_key)
+        if cached is not None:
+            yield {"type": "text", "text": cached}
+            return
+
+        api_params = self._build_params(query, conversation_history, tools)
+        messages = api_params["messages"]
+        if max_tool_rounds is None:
+            max_tool_rounds = self.MAX_TOOL_ROUNDS
+
+        for round_num in range(max_tool_rounds + 1):
+            may_use_tools = bool(tool_manager) and round_num < max_tool_rounds and "tools" in api_params
+            chunks = []
+            async with self.client.messages.stream(**api_params) as stream:
+                async for event in stream:
+                    if event.type == "text":
+                        chunks.append(event.text)
+                        yield {"type": "text", "text": event.text}
+                    elif (event.type == "content_block_start" and event.content_block.type == "tool_use"
+                          and may_use_tools and chunks):
+                        # The tool call will run, so the text so far was only a preamble
+                        chunks.clear()
+                        yield {"type": "reset"}
+                response = await stream.get_final_message()
+
+            tool_results = None
+            if may_use_tools and response.stop_reason == "tool_use":
+                tool_results, tool_failed = await self._execute_tool_calls(
+                    response.content, tool_manager, sources
+                )
+
+            # No tools to run (including tool_use without any tool_use blocks):
+            # this round's text is the answer
+            if not tool_results:
+                if response.stop_reason != "tool_use" and round_num == 0:
+                    self._cache_response(cache_key, "".join(chunks))
+                return
+            messages.append({"role": "assistant", "content": response.content})
+            messages.append(self._user_message(tool_results))
+            self._fit_context(api_params)
+
+            # Last round, or a tool failed: the next call must produce the answer
+            if tool_failed or round_num == max_tool_rounds - 1:
+                api_params.pop("tools", None)
+                api_params.pop("tool_choice", None)
+
+    def _build_params(self, query: str, conversation_history: Optional[str], tools: Optional[List]) -> Dict[str, Any]:
+        """Assemble the parameters for the first API call of a query"""
+        # Static prompt first so it (and the tools ahead of it) form a cacheable prefix
+        system_content = [self.SYSTEM_BLOCK]
+        if conversation_history:
+            system_content.append({
+                "type": "text",
+                "text": f"Previous conversation:\n{self._trim_history(conversation_history)}"
+            })
+
         api_params = {
             **self.base_params,
-            "messages": [{"role": "user", "content": query}],
+            "messages": [self._user_message(query)],
             "system": system_content
         }
-        
+
         # Add tools if available
         if tools:
             api_params["tools"] = tools
-            api_params["tool_choice"] = {"type": "auto"}
-        
-        # Get response from Claude
-        response = self.client.messages.create(**api_params)
-        
-        # Handle tool execution if needed
-        if response.stop_reason == "tool_use" and tool_manager:
-            return self._handle_tool_execution(response, api_params, tool_manager, tools)
-        
-        # Return direct response
-        return response.content[0].text
+            api_params["tool_choice"] = self.TOOL_CHOICE_AUTO
+        return api_params
+
+    @staticmethod
+    def _response_text(response) -> str:
+        """Return the first text block of a response, or "" if it has none"""
+        return next((block.text for block in response.content if block.type == "text"), "")
+
+    @staticmethod
+    def _user_message(content) -> Dict[str, Any]:
+        """Wrap text or content blocks as a user turn"""
+        return {"role": "user", "content": content}
+
+    def _fit_context(self, api_params: Dict[str, Any]):
+        """
+        Truncate the oldest tool results until the request fits the context window.
+
+        The size is estimated from character counts, which is far cheaper than
+        tokenizing and spares the round-trip of a request the API would reject.
+        """
+        budget = int((self.MAX_CONTEXT_TOKENS - api_params["max_tokens"]) * self.CHARS_PER_TOKEN)
+        excess = self._estimate_chars(api_params) - budget
+        if excess <= 0:
+            return
+
+        for message in api_params["messages"]:
+            if isinstance(message["content"], str):
+                continue
+            for block in message["content"]:
+                if not isinstance(block, dict) or block.get("type") != "tool_result":
+                    continue
+                content = block["content"]
+                if len(content) <= len(self.TRUNCATION_MARKER):
+                    continue
+                keep = max(len(content) - excess - len(self.TRUNCATION_MARKER), 0)
+                block["content"] = content[:keep] + self.TRUNCATION_MARKER
+                excess -= len(content) - len(block["content"])
+                if excess <= 0:
+                    return
+
+    @staticmethod
+    def _estimate_chars(api_params: Dict[str, Any]) -> int:
+        """Count the characters of text a request carries"""
+        total = sum(len(block["text"]) for block in api_params["system"])
+        for message in api_params["messages"]:
+            content = message["content"]
+            if isinstance(content, str):
+                total += len(content)
+                continue
+            for block in content:
+                if isinstance(block, dict):
+                    total += len(block.get("content", ""))
+                else:
+                    # SDK blocks from an assistant turn: text, or a tool call
+                    total += len(getattr(block, "text", None) or str(getattr(block, "input", "")))
+        return total
+
+    def _trim_history(self, conversation_history: str) -> str:
+        """Keep the most recent part of the history that fits in MAX_HISTORY_CHARS"""
+        if len(conversation_history) <= self.MAX_HISTORY_CHARS:
+            return conversation_history
+        window = conversation_history[-self.MAX_HISTORY_CHARS:]
+        # Start the window on a line boundary rather than mid-sentence
+        line_start = window.find("\n")
+        return window[line_start + 1:] if line_start != -1 else window
+
+    def _cache_key(self, query: str, conversation_history: Optional[str], tools: Optional[List]) -> str:
+        """Fingerprint the inputs that determine a response"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(query.encode())
+        digest.update(b"\0")
+        digest.update((conversation_history or "").encode())
+        digest.update(b"\0")
+        digest.update(self._serialize_tools(tools))
+        return digest.hexdigest()
+
+    def _serialize_tools(self, tools: Optional[List]) -> bytes:
+        """Serialize tool definitions, reusing the last result for the same list"""
+        cached_tools, serialized = self._tools_fingerprint
+        if tools is not cached_tools:
+            serialized = json.dumps(tools, sort_keys=True).encode()
+            self._tools_fingerprint = (tools, serialized)
+        return serialized
+
+    def _cached_response(self, cache_key: str) -> Optional[str]:
+        """Look up a cached response, marking it as recently used"""
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            self._response_cache.move_to_end(cache_key)
+        return cached
+
+    def _cache_response(self, cache_key: str, text: str):
+        """Store a response, evicting the least recently used entry when full"""
+        self._response_cache[cache_key] = text
+        self._response_cache.move_to_end(cache_key)
+        if len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
     
-    def _handle_tool_execution(self, initial_response, base_params: Dict[str, Any], tool_manager, tools=None):
+    async def _handle_tool_execution(self, initial_response, api_params: Dict[str, Any], tool_manager,
+                                     max_tool_rounds: int, sources: Optional[list] = None):
         """
-        Handle execution of tool calls with up to MAX_TOOL_ROUNDS sequential rounds.
+        Handle execution of tool calls with up to max_tool_rounds sequential rounds.
 
         Args:
             initial_response: The response containing tool use requests
-            base_params: Base API parameters
+            api_params: Parameters of the initial call, updated in place for follow-up calls
             tool_manager: Manager to execute tools
-            tools: Tool definitions to include in intermediate API calls
+            max_tool_rounds: Number of tool rounds before Claude must answer
+            sources: List that collects the sources of the tool calls, if given
 
         Returns:
             Final response text after tool execution
         """
-        messages = base_params["messages"].copy()
+        # _build_params made this list for this query alone, so extend it in place
+        messages = api_params["messages"]
         current_response = initial_response
 
-        for round_num in range(self.MAX_TOOL_ROUNDS):
-            # Append assistant's tool-use message
+        for round_num in range(max_tool_rounds):
+            # Execute all tool calls concurrently and collect results
+            tool_results, tool_failed = await self._execute_tool_calls(
+                current_response.content, tool_manager, sources
+            )
+
+            # No tool_use blocks to answer: the response text is already final
+            if not tool_results:
+                return self._response_text(current_response)
+
+            # Append assistant's tool-use message and the tool results
             messages.append({"role": "assistant", "content": current_response.content})
+            messages.append(self._user_message(tool_results))
+            self._fit_context(api_params)
+
+            # Last round, or a tool failed: withhold tools so Claude has to answer
+            final_round = tool_failed or round_num == max_tool_rounds - 1
+            if final_round:
+                api_params.pop("tools", None)
+                api_params.pop("tool_choice", None)
 
-            # Execute all tool calls and collect results
-            tool_results = []
-            tool_failed = False
-            for block in current_response.content:
-                if block.type == "tool_use":
-                    result = tool_manager.execute_tool(block.name, **block.input)
-                    if result == f"Tool '{block.name}' not found":
-                        tool_failed = True
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": block.id,
-                        "content": result
-                    })
-
-            # Append tool results as user message
-            if tool_results:
-                messages.append({"role": "user", "content": tool_results})
-
-            if tool_failed:
+            current_response = await self.client.messages.create(**api_params)
+
+            if final_round or current_response.stop_reason != "tool_use":
                 break
 
-            is_last_round = (round_num == self.MAX_TOOL_ROUNDS - 1)
+        return self._response_text(current_response)
 
-            next_params = {
-                **self.base_params,
-                "messages": messages,
-                "system": base_params["system"]
-            }
-            if tools and not is_last_round:
-                next_params["tools"] = tools
-                next_params["tool_choice"] = {"type": "auto"}
+    async def _execute_tool_calls(self, content, tool_manager, sources: Optional[list] = None):
+        """
+        Run every tool_use block in a response concurrently.
 
-            current_response = self.client.messages.create(**next_params)
+        Tools are synchronous, so each call runs in a worker thread; the round
+        takes as long as its slowest tool rather than the sum of all of them.
 
-            if current_response.stop_reason != "tool_use":
-                break
+        Args:
+            content: Content blocks from a tool_use response
+            tool_manager: Manager to execute tools
+            sources: List to extend with the calls' sources, in request order and
+                without duplicates; sources are not collected if not given
+
+        Returns:
+            Tuple of (tool_result blocks in request order, whether any tool was unknown)
+        """
+        tool_blocks = [block for block in content if block.type == "tool_use"]
+
+        async def run(block):
+            # Unknown tools are reported back to Claude without being dispatched
+            if not tool_manager.has_tool(block.name):
+                return None
+            async with self._tool_semaphore:
+                if sources is None:
+                    return await asyncio.to_thread(tool_manager.execute_tool, block.name, **block.input), []
+                # Sources come back with each call: concurrent calls and queries
+                # share the tools, so nothing is read from tool state afterwards
+                return await asyncio.to_thread(
+                    tool_manager.execute_tool_with_sources, block.name, **block.input
+                )
 
-        # Defensive fallback: if still in tool_use after loop, call once more without tools
-        if current_response.stop_reason == "tool_use":
-            fallback_params = {
-                **self.base_params,
-                "messages": messages,
-                "system": base_params["system"]
-            }
-            current_response = self.client.messages.create(**fallback_params)
+        outcomes = await asyncio.gather(*(run(block) for block in tool_blocks))
 
-        return current_response.content[0].text
\ No newline at end of file
+        tool_results = []
+        tool_failed = False
+        for block, outcome in zip(tool_blocks, outcomes):
+            if outcome is None:
+                tool_failed = True
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": block.id,
+                    "content": f"Tool '{block.name}' not found",
+                    "is_error": True
+                })
+                continue
+            result, block_sources = outcome
+            if sources is not None:
+                for source in block_sources:
+                    if source not in sources:
+                        sources.append(source)
+            tool_results.append({
+                "type": "tool_result",
+                "tool_use_id": block.id,
+                "content": result
+            })
+        return tool_results, tool_failed
\ No newline at end of file
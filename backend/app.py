@@ -5,8 +5,10 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import json
 import os
 
 from config import config
@@ -68,7 +70,7 @@ async def query_documents(request: QueryRequest):
             session_id = rag_system.session_manager.create_session()
         
         # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
+        answer, sources = await rag_system.query(request.query, session_id)
         
         return QueryResponse(
             answer=answer,
@@ -78,6 +80,29 @@ async def query_documents(request: QueryRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Process a query and stream the answer as server-sent events"""
+    try:
+        # Create session if not provided
+        session_id = request.session_id
+        if not session_id:
+            session_id = rag_system.session_manager.create_session()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        # Headers are already sent once streaming starts, so errors become events
+        try:
+            async for event in rag_system.query_stream(request.query, session_id):
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+            return
+        yield f"data: {json.dumps({'type': 'done', 'session_id': session_id})}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.delete("/api/session/{session_id}")
 async def clear_session(session_id: str):
     """Clear conversation history for a session"""
@@ -1,4 +1,4 @@
-from typing import List, Tuple, Optional, Dict
+from typing import AsyncIterator, List, Tuple, Optional, Dict, Any
 import os
 from document_processor import DocumentProcessor
 from vector_store import VectorStore
@@ -10,6 +10,11 @@ from models import Course, Lesson, CourseChunk
 class RAGSystem:
     """Main orchestrator for the Retrieval-Augmented Generation system"""
     
+    # Queries shorter than this, without a word suggesting several steps,
+    # are given a single tool round
+    SIMPLE_QUERY_CHARS = 20
+    MULTI_STEP_WORDS = frozenset({"and", "then", "also"})
+    
     def __init__(self, config):
         self.config = config
         
@@ -18,6 +23,7 @@ class RAGSystem:
         self.vector_store = VectorStore(config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS)
         self.ai_generator = AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL)
         self.session_manager = SessionManager(config.MAX_HISTORY)
+        self.max_tool_rounds = config.MAX_TOOL_ROUNDS
         
         # Initialize search tools
         self.tool_manager = ToolManager()
@@ -101,7 +107,7 @@ class RAGSystem:
         
         return total_courses, total_chunks
     
-    def query(self, query: str, session_id: Optional[str] = None) -> Tuple[str, List[str]]:
+    async def query(self, query: str, session_id: Optional[str] = None) -> Tuple[str, List[str]]:
         """
         Process a user query using the RAG system with tool-based search.
         
@@ -110,7 +116,7 @@ class RAGSystem:
             session_id: Optional session ID for conversation context
             
         Returns:
-            Tuple of (response, sources list - empty for tool-based approach)
+            Tuple of (response, sources found by this query's searches)
         """
         # Create prompt for the AI with clear instructions
         prompt = f"""Answer this question about course materials: {query}"""
@@ -120,20 +126,17 @@ class RAGSystem:
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
         
-        # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
+        # Generate response using AI with tools, collecting this query's sources
+        sources = []
+        response = await self.ai_generator.generate_response(
             query=prompt,
             conversation_history=history,
             tools=self.tool_manager.get_tool_definitions(),
-            tool_manager=self.tool_manager
+            tool_manager=self.tool_manager,
+            max_tool_rounds=self._tool_rounds_for(query),
+            sources=sources
         )
         
-        # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
-
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
-        
         # Update conversation history
         if session_id:
             self.session_manager.add_exchange(session_id, query, response)
@@ -141,6 +144,53 @@ class RAGSystem:
         # Return response with sources from tool searches
         return response, sources
     
+    async def query_stream(self, query: str, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a user query like query(), streaming the answer as it is generated.
+        
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+            
+        Yields:
+            {"type": "text", "text": ...} events while the answer is generated,
+            {"type": "reset"} events when the text so far was a tool-call
+            preamble to discard, then a single {"type": "sources", "sources": [...]} event
+        """
+        prompt = f"""Answer this question about course materials: {query}"""
+        
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+        
+        chunks = []
+        sources = []
+        async for event in self.ai_generator.generate_response_stream(
+            query=prompt,
+            conversation_history=history,
+            tools=self.tool_manager.get_tool_definitions(),
+            tool_manager=self.tool_manager,
+            max_tool_rounds=self._tool_rounds_for(query),
+            sources=sources
+        ):
+            if event["type"] == "reset":
+                chunks.clear()
+            else:
+                chunks.append(event["text"])
+            yield event
+        
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, "".join(chunks))
+        
+        yield {"type": "sources", "sources": sources}
+    
+    def _tool_rounds_for(self, query: str) -> int:
+        """Allow a single tool round for short questions that read as single-step"""
+        words = set(query.lower().split())
+        if len(query) < self.SIMPLE_QUERY_CHARS and not words & self.MULTI_STEP_WORDS:
+            return 1
+        return self.max_tool_rounds
+    
     def get_course_analytics(self) -> Dict:
         """Get analytics about the course catalog"""
         return {
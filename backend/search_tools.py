@@ -1,4 +1,4 @@
-from typing import Dict, Any, Optional, Protocol
+from typing import Dict, Any, List, Optional, Protocol, Tuple
 from abc import ABC, abstractmethod
 from vector_store import VectorStore, SearchResults
 
@@ -15,6 +15,10 @@ class Tool(ABC):
     def execute(self, **kwargs) -> str:
         """Execute the tool with given parameters"""
         pass
+    
+    def execute_with_sources(self, **kwargs) -> Tuple[str, List[Dict[str, Any]]]:
+        """Execute the tool, also returning the sources it produced (none by default)"""
+        return self.execute(**kwargs), []
 
 
 class CourseSearchTool(Tool):
@@ -61,6 +65,22 @@ class CourseSearchTool(Tool):
         Returns:
             Formatted search results or error message
         """
+        result, sources = self.execute_with_sources(query, course_name, lesson_number)
+        if sources:
+            # Store sources for retrieval
+            self.last_sources = sources
+        return result
+    
+    def execute_with_sources(self, query: str, course_name: Optional[str] = None,
+                             lesson_number: Optional[int] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Execute the search like execute(), returning its sources instead of storing them.
+        
+        Touches no shared state, so concurrent queries can't pick up each other's sources.
+        
+        Returns:
+            Tuple of (formatted search results or error message, sources for the UI)
+        """
         # Use the vector store's unified search interface
         results = self.store.search(
             query=query,
@@ -70,7 +90,7 @@ class CourseSearchTool(Tool):
         
         # Handle errors
         if results.error:
-            return results.error
+            return results.error, []
         
         # Handle empty results
         if results.is_empty():
@@ -79,13 +99,13 @@ class CourseSearchTool(Tool):
                 filter_info += f" in course '{course_name}'"
             if lesson_number:
                 filter_info += f" in lesson {lesson_number}"
-            return f"No relevant content found{filter_info}."
+            return f"No relevant content found{filter_info}.", []
         
         # Format and return results
         return self._format_results(results)
     
-    def _format_results(self, results: SearchResults) -> str:
-        """Format search results with course and lesson context"""
+    def _format_results(self, results: SearchResults) -> Tuple[str, List[Dict[str, Any]]]:
+        """Format search results with course and lesson context, along with their sources"""
         formatted = []
         sources = []  # Track sources for the UI
         
@@ -114,10 +134,7 @@ class CourseSearchTool(Tool):
             
             formatted.append(f"{header}\n{doc}")
         
-        # Store sources for retrieval
-        self.last_sources = sources
-        
-        return "\n\n".join(formatted)
+        return "\n\n".join(formatted), sources
 
 class CourseOutlineTool(Tool):
     """Tool for retrieving a course's structured outline from the catalog."""
@@ -165,6 +182,7 @@ class ToolManager:
     
     def __init__(self):
         self.tools = {}
+        self._tool_definitions = None  # Built on first use, reset on registration
     
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -173,11 +191,18 @@ class ToolManager:
         if not tool_name:
             raise ValueError("Tool must have a 'name' in its definition")
         self.tools[tool_name] = tool
+        self._tool_definitions = None
 
     
     def get_tool_definitions(self) -> list:
-        """Get all tool definitions for Anthropic tool calling"""
-        return [tool.get_tool_definition() for tool in self.tools.values()]
+        """Get all tool definitions for Anthropic tool calling (shared; do not mutate)"""
+        if self._tool_definitions is None:
+            self._tool_definitions = [tool.get_tool_definition() for tool in self.tools.values()]
+        return self._tool_definitions
+    
+    def has_tool(self, tool_name: str) -> bool:
+        """Check whether a tool is registered under the given name"""
+        return tool_name in self.tools
     
     def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a tool by name with given parameters"""
@@ -186,6 +211,13 @@ class ToolManager:
         
         return self.tools[tool_name].execute(**kwargs)
     
+    def execute_tool_with_sources(self, tool_name: str, **kwargs) -> Tuple[str, list]:
+        """Execute a tool by name, also returning the sources this call produced"""
+        if tool_name not in self.tools:
+            return f"Tool '{tool_name}' not found", []
+        
+        return self.tools[tool_name].execute_with_sources(**kwargs)
+    
     def get_last_sources(self) -> list:
         """Get sources from the last search operation"""
         # Check all tools for last_sources attribute
@@ -1,7 +1,7 @@
 import sys
 import os
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, Mock
 
 # Add backend directory to path so test files can import backend modules directly
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,7 +12,7 @@ from vector_store import SearchResults
 @pytest.fixture
 def mock_config():
     """Minimal config mock shared across all test modules."""
-    config = MagicMock()
+    config = Mock()
     config.ANTHROPIC_API_KEY = "test_key"
     config.ANTHROPIC_MODEL = "test-model"
     config.EMBEDDING_MODEL = "all-MiniLM-L6-v2"
@@ -20,6 +20,7 @@ def mock_config():
     config.CHUNK_OVERLAP = 100
     config.MAX_RESULTS = 5
     config.MAX_HISTORY = 2
+    config.MAX_TOOL_ROUNDS = 2
     config.CHROMA_PATH = "./test_chroma"
     return config
 
@@ -33,96 +34,178 @@ def sample_sources():
     ]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_search_results():
-    """A valid SearchResults object with one document."""
+    """A valid SearchResults object with one document. Shared read-only, so
+    its sequences are tuples."""
     return SearchResults(
-        documents=["This is lesson content about Python basics and data types."],
-        metadata=[{"course_title": "Python Course", "lesson_number": 1}],
-        distances=[0.1]
+        documents=("This is lesson content about Python basics and data types.",),
+        metadata=({"course_title": "Python Course", "lesson_number": 1},),
+        distances=(0.1,)
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def empty_search_results():
-    """A SearchResults with empty lists (no results found)."""
+    """A SearchResults with no documents (no results found). Shared read-only."""
     return SearchResults(
-        documents=[],
-        metadata=[],
-        distances=[]
+        documents=(),
+        metadata=(),
+        distances=()
     )
 
 
+class FakeVectorStore:
+    """The slice of VectorStore used by the search tools, with canned answers.
+
+    Set `results` to change what search() returns; every search is recorded
+    in `search_calls`.
+    """
+
+    def __init__(self, results, link="https://example.com/lesson1"):
+        self.results = results
+        self.link = link
+        self.course_link = "https://example.com/course"
+        self.outline = {
+            "title": "Python Course",
+            "course_link": "https://example.com/course",
+            "lessons": [
+                {"lesson_number": 1, "lesson_title": "Introduction to Python"}
+            ]
+        }
+        self.search_calls = []
+
+    def search(self, *, query, course_name=None, lesson_number=None):
+        self.search_calls.append(
+            {"query": query, "course_name": course_name, "lesson_number": lesson_number}
+        )
+        return self.results
+
+    def get_lesson_link(self, course_title, lesson_number):
+        return self.link
+
+    def get_course_link(self, course_title):
+        return self.course_link
+
+    def get_course_outline(self, course_name):
+        return self.outline
+
+
 @pytest.fixture
-def mock_vector_store(sample_search_results):
-    """MagicMock of VectorStore with sensible defaults pre-configured."""
-    mock = MagicMock()
-    mock.search.return_value = sample_search_results
-    mock.get_lesson_link.return_value = "https://example.com/lesson1"
-    mock.get_course_link.return_value = "https://example.com/course"
-    mock.get_course_outline.return_value = {
-        "title": "Python Course",
-        "course_link": "https://example.com/course",
-        "lessons": [
-            {"lesson_number": 1, "lesson_title": "Introduction to Python"}
-        ]
-    }
-    return mock
+def fake_vector_store(sample_search_results):
+    """FakeVectorStore returning sample_search_results."""
+    return FakeVectorStore(sample_search_results)
+
+
+@pytest.fixture
+def search_tool(fake_vector_store):
+    """CourseSearchTool backed by fake_vector_store."""
+    from search_tools import CourseSearchTool
+
+    return CourseSearchTool(fake_vector_store)
+
+
+@pytest.fixture
+def tool_manager(search_tool):
+    """ToolManager with search_tool registered."""
+    from search_tools import ToolManager
+
+    manager = ToolManager()
+    manager.register_tool(search_tool)
+    return manager
 
 
 # ---------------------------------------------------------------------------
 # API-level fixtures
 # ---------------------------------------------------------------------------
 
+class _MockStaticFiles:
+    """Minimal ASGI stub mounted at '/' in place of the real StaticFiles."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        from starlette.responses import HTMLResponse
+        await HTMLResponse("<html><body>Test frontend</body></html>")(scope, receive, send)
+
+
+# Default /api/query result, shared by every test (the endpoint only reads it)
+_DEFAULT_ANSWER = (
+    "Python is a high-level programming language.",
+    ({"label": "Python Basics - Lesson 1", "url": "https://example.com/lesson1"},),
+)
+
+
 @pytest.fixture
 def mock_rag_instance():
-    """Pre-configured MagicMock for RAGSystem, suitable for API-level tests."""
-    mock = MagicMock()
-    mock.query.return_value = (
-        "Python is a high-level programming language.",
-        [{"label": "Python Basics - Lesson 1", "url": "https://example.com/lesson1"}],
-    )
-    mock.get_course_analytics.return_value = {
-        "total_courses": 2,
-        "course_titles": ["Python Basics", "FastAPI Course"],
-    }
-    mock.session_manager.create_session.return_value = "new-session-123"
-    return mock
+    """Bare Mock standing in for RAGSystem in API-level tests.
+
+    A plain Mock is enough (and cheaper than MagicMock) since app.py never
+    uses magic methods on the RAG system. Tests configure only what their
+    endpoint reads, directly or through mock_rag_query.
+    """
+    return Mock()
 
 
 @pytest.fixture
-def api_client(mock_rag_instance):
-    """TestClient for the real FastAPI app with all external deps patched.
+def mock_rag_query(mock_rag_instance):
+    """mock_rag_instance set up for /api/query: an answer and a new session id."""
+    mock_rag_instance.query = AsyncMock(return_value=_DEFAULT_ANSWER)
+    mock_rag_instance.session_manager.create_session.return_value = "new-session-123"
+    return mock_rag_instance
+
+
+@pytest.fixture(scope="session")
+def _app():
+    """The app module, imported once per session with all external deps patched.
 
     A lightweight _MockStaticFiles replaces Starlette's StaticFiles so that
-    importing app.py succeeds without a real frontend/ directory on disk.
-    The module-level rag_system in app.py is replaced with mock_rag_instance
-    so endpoint functions use the test mock for every request.
+    importing app.py succeeds without a real frontend/ directory on disk, and
+    RAGSystem is replaced so no ChromaDB or embedding model is loaded.
     """
-    from fastapi.testclient import TestClient
-
-    class _MockStaticFiles:
-        """Minimal ASGI stub mounted at '/' in place of the real StaticFiles."""
+    # Remove any cached import so that the patched symbols take effect.
+    sys.modules.pop("app", None)
 
-        def __init__(self, *args, **kwargs):
-            pass
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("fastapi.staticfiles.StaticFiles", _MockStaticFiles)
+        mp.setattr("rag_system.RAGSystem", Mock())
+        import app as app_module
 
-        async def __call__(self, scope, receive, send):
-            if scope["type"] != "http":
-                return
-            from starlette.responses import HTMLResponse
-            await HTMLResponse("<html><body>Test frontend</body></html>")(scope, receive, send)
+    yield app_module
 
-    # Remove any cached import so that the patched symbols take effect.
     sys.modules.pop("app", None)
 
-    with patch("fastapi.staticfiles.StaticFiles", _MockStaticFiles), \
-         patch("rag_system.RAGSystem", return_value=mock_rag_instance):
-        import app as _app_module
 
-    # Replace the module-level variable so endpoint closures resolve to our mock.
-    _app_module.rag_system = mock_rag_instance
+@pytest.fixture(scope="session")
+def anyio_backend():
+    """Session-wide so async session fixtures share the tests' event loop."""
+    return "asyncio"
 
-    yield TestClient(_app_module.app)
 
-    sys.modules.pop("app", None)
+@pytest.fixture(scope="session")
+async def aclient(_app):
+    """httpx AsyncClient that calls the real FastAPI app in-process over ASGI.
+
+    One client and transport serve the whole session. Requests run on the
+    tests' event loop, with no TestClient thread or portal in between. The
+    app's startup handler is not run.
+    """
+    import httpx
+
+    transport = httpx.ASGITransport(app=_app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def api_client(_app, aclient, mock_rag_instance):
+    """aclient with the app's rag_system bound to this test's mock.
+
+    Endpoint functions look up the module-level rag_system on every request,
+    so rebinding it is all the per-test setup needed.
+    """
+    _app.rag_system = mock_rag_instance
+    return aclient
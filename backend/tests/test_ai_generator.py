@@ -1,20 +1,39 @@
 import pytest
-from unittest.mock import MagicMock, patch
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Dict, List
+from unittest.mock import AsyncMock, MagicMock, patch
+
+pytestmark = pytest.mark.anyio
 
 
 # ---------------------------------------------------------------------------
-# Helpers to build mock Anthropic response objects
+# Helpers to build stub Anthropic response objects
 # ---------------------------------------------------------------------------
 
+@dataclass(slots=True)
+class _TextBlock:
+    text: str
+    type: str = "text"
+
+
+@dataclass(slots=True)
+class _ToolUseBlock:
+    name: str
+    input: Dict[str, Any]
+    id: str
+    type: str = "tool_use"
+
+
+@dataclass(slots=True)
+class _Response:
+    stop_reason: str
+    content: List[Any] = field(default_factory=list)
+
+
 def make_text_response(text="Direct answer", stop_reason="end_turn"):
-    """Build a mock Anthropic response with a text content block."""
-    response = MagicMock()
-    response.stop_reason = stop_reason
-    text_block = MagicMock()
-    text_block.type = "text"
-    text_block.text = text
-    response.content = [text_block]
-    return response
+    """Build a stub Anthropic response with a text content block."""
+    return _Response(stop_reason=stop_reason, content=[_TextBlock(text=text)])
 
 
 def make_tool_use_response(
@@ -22,20 +41,49 @@ def make_tool_use_response(
     tool_input=None,
     tool_id="tool_123"
 ):
-    """Build a mock Anthropic response requesting a tool call."""
+    """Build a stub Anthropic response requesting a tool call."""
     if tool_input is None:
         tool_input = {"query": "test query"}
 
-    response = MagicMock()
-    response.stop_reason = "tool_use"
+    return _Response(
+        stop_reason="tool_use",
+        content=[_ToolUseBlock(name=tool_name, input=tool_input, id=tool_id)],
+    )
+
+
+class FakeStream:
+    """Stand-in for the SDK's async message stream context manager: emits a
+    text event per chunk, then a content_block_start event per tool_use block."""
+
+    def __init__(self, response, chunks=()):
+        self.response = response
+        self.chunks = chunks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield SimpleNamespace(type="text", text=chunk)
+        for block in self.response.content:
+            if block.type == "tool_use":
+                yield SimpleNamespace(type="content_block_start", content_block=block)
+
+    async def get_final_message(self):
+        return self.response
+
+
+async def collect(stream):
+    """Drain an async iterator into a list."""
+    return [chunk async for chunk in stream]
+
 
-    tool_block = MagicMock()
-    tool_block.type = "tool_use"
-    tool_block.name = tool_name
-    tool_block.input = tool_input
-    tool_block.id = tool_id
-    response.content = [tool_block]
-    return response
+def text_events(*texts):
+    """The text events generate_response_stream yields for `texts`."""
+    return [{"type": "text", "text": text} for text in texts]
 
 
 # ---------------------------------------------------------------------------
@@ -45,28 +93,168 @@ def make_tool_use_response(
 @pytest.fixture
 def ai_generator():
     """AIGenerator instance with a mocked Anthropic client."""
-    with patch("anthropic.Anthropic"):
-        from ai_generator import AIGenerator
+    from ai_generator import AIGenerator, _get_client
+    # Clients are cached per API key; start from an empty cache so each test
+    # gets its own mock client.
+    _get_client.cache_clear()
+    with patch("anthropic.AsyncAnthropic"):
         gen = AIGenerator(api_key="test_key", model="test-model")
     # gen.client is a MagicMock set during __init__; the patch is no longer
-    # needed after construction.
-    return gen
+    # needed after construction. messages.create is awaited, so make it async.
+    gen.client.messages.create = AsyncMock()
+    yield gen
+    _get_client.cache_clear()
 
 
 # ---------------------------------------------------------------------------
 # Tests
 # ---------------------------------------------------------------------------
 
-def test_direct_response_no_tools(ai_generator):
+def test_generators_share_client_per_api_key(ai_generator):
+    """Generators built with the same API key reuse one client (and its
+    connection pool)."""
+    from ai_generator import AIGenerator
+
+    other = AIGenerator(api_key="test_key", model="other-model")
+
+    assert other.client is ai_generator.client
+
+
+def test_orjson_client_encodes_request_body():
+    """The orjson-backed httpx client produces the same JSON body as httpx's
+    stdlib encoder."""
+    pytest.importorskip("orjson")
+    import json
+    from ai_generator import _http_client_class
+
+    payload = {"messages": [{"role": "user", "content": "What is Python? ✓"}], "max_tokens": 800}
+    request = _http_client_class()().build_request(
+        "POST", "https://example.com", json=payload, headers={"Content-Type": "application/json"}
+    )
+
+    assert json.loads(request.content) == payload
+
+
+async def test_direct_response_no_tools(ai_generator):
     """When stop_reason == 'end_turn', generate_response returns content[0].text."""
     ai_generator.client.messages.create.return_value = make_text_response("Direct answer")
 
-    result = ai_generator.generate_response("What is Python?")
+    result = await ai_generator.generate_response("What is Python?")
 
     assert result == "Direct answer"
 
 
-def test_tool_use_triggers_handle_tool_execution(ai_generator):
+async def test_bare_query_sends_minimal_params(ai_generator):
+    """Without tools or history the call carries only the system prompt and
+    the user message."""
+    ai_generator.client.messages.create.return_value = make_text_response()
+
+    await ai_generator.generate_response("What is Python?")
+
+    kwargs = ai_generator.client.messages.create.call_args[1]
+    assert kwargs["system"] == [ai_generator.SYSTEM_BLOCK]
+    assert kwargs["messages"] == [{"role": "user", "content": "What is Python?"}]
+    assert "tools" not in kwargs
+    assert "tool_choice" not in kwargs
+
+
+async def test_system_prompt_marked_for_prompt_caching(ai_generator):
+    """The static system prompt is sent as its own block with a cache breakpoint,
+    and conversation history follows it in a separate, uncached block."""
+    ai_generator.client.messages.create.return_value = make_text_response()
+
+    await ai_generator.generate_response(
+        "query", conversation_history="User: hi\nAssistant: hello"
+    )
+
+    system = ai_generator.client.messages.create.call_args[1]["system"]
+    assert system[0]["text"] == ai_generator.SYSTEM_PROMPT
+    assert system[0]["cache_control"] == {"type": "ephemeral"}
+    assert len(system) == 2
+    assert "User: hi" in system[1]["text"]
+    assert "cache_control" not in system[1]
+
+
+async def test_long_history_trimmed_to_recent_window(ai_generator):
+    """History longer than MAX_HISTORY_CHARS is cut to its most recent lines so
+    the request size stays bounded."""
+    ai_generator.MAX_HISTORY_CHARS = 40
+    ai_generator.client.messages.create.return_value = make_text_response()
+    history = "User: old question\nAssistant: old answer\nUser: newest question"
+
+    await ai_generator.generate_response("query", conversation_history=history)
+
+    history_block = ai_generator.client.messages.create.call_args[1]["system"][1]
+    assert history_block["text"] == "Previous conversation:\nUser: newest question"
+
+
+async def test_repeated_query_served_from_cache(ai_generator):
+    """An identical (query, history, tools) call is answered without a second
+    API call."""
+    ai_generator.client.messages.create.return_value = make_text_response("Cached answer")
+
+    first = await ai_generator.generate_response("What is Python?")
+    second = await ai_generator.generate_response("What is Python?")
+
+    assert first == second == "Cached answer"
+    assert ai_generator.client.messages.create.call_count == 1
+
+
+async def test_cache_key_includes_history(ai_generator):
+    """The same query with different conversation history is not a cache hit."""
+    ai_generator.client.messages.create.return_value = make_text_response()
+
+    await ai_generator.generate_response("What is Python?")
+    await ai_generator.generate_response("What is Python?", conversation_history="User: hi")
+
+    assert ai_generator.client.messages.create.call_count == 2
+
+
+async def test_cache_key_tracks_tool_list_changes(ai_generator):
+    """The memoized tool fingerprint is recomputed when a different tool list
+    is passed, so a changed tool set is not a cache hit."""
+    ai_generator.client.messages.create.return_value = make_text_response()
+    tools_a = [{"name": "search_course_content"}]
+    tools_b = [{"name": "get_course_outline"}]
+
+    await ai_generator.generate_response("What is Python?", tools=tools_a)
+    await ai_generator.generate_response("What is Python?", tools=tools_a)
+    await ai_generator.generate_response("What is Python?", tools=tools_b)
+
+    assert ai_generator.client.messages.create.call_count == 2
+
+
+async def test_tool_use_responses_not_cached(ai_generator):
+    """Answers that went through tool execution are always regenerated."""
+    ai_generator.client.messages.create.side_effect = [
+        make_tool_use_response(), make_text_response("First"),
+        make_tool_use_response(), make_text_response("Second"),
+    ]
+    mock_tool_manager = MagicMock()
+    mock_tool_manager.execute_tool.return_value = "results"
+
+    first = await ai_generator.generate_response("query", tool_manager=mock_tool_manager)
+    second = await ai_generator.generate_response("query", tool_manager=mock_tool_manager)
+
+    assert (first, second) == ("First", "Second")
+    assert ai_generator.client.messages.create.call_count == 4
+
+
+async def test_response_cache_evicts_least_recently_used(ai_generator):
+    """The cache never grows past RESPONSE_CACHE_SIZE entries."""
+    ai_generator.RESPONSE_CACHE_SIZE = 2
+    ai_generator.client.messages.create.return_value = make_text_response()
+
+    for query in ("a", "b", "a", "c"):
+        await ai_generator.generate_response(query)
+    await ai_generator.generate_response("a")
+
+    # "b" was evicted when "c" arrived; "a" stayed hot and is still cached
+    assert len(ai_generator._response_cache) == 2
+    assert ai_generator.client.messages.create.call_count == 3
+
+
+async def test_tool_use_triggers_handle_tool_execution(ai_generator):
     """When stop_reason == 'tool_use' and tool_manager is supplied, a second API
     call is made and its text is returned."""
     first = make_tool_use_response()
@@ -76,7 +264,7 @@ def test_tool_use_triggers_handle_tool_execution(ai_generator):
     mock_tool_manager = MagicMock()
     mock_tool_manager.execute_tool.return_value = "search results"
 
-    result = ai_generator.generate_response(
+    result = await ai_generator.generate_response(
         "Search for Python", tool_manager=mock_tool_manager
     )
 
@@ -84,7 +272,7 @@ def test_tool_use_triggers_handle_tool_execution(ai_generator):
     assert ai_generator.client.messages.create.call_count == 2
 
 
-def test_handle_tool_execution_calls_tool_manager(ai_generator):
+async def test_handle_tool_execution_calls_tool_manager(ai_generator):
     """tool_manager.execute_tool is called with the correct tool name and inputs."""
     first = make_tool_use_response(
         tool_name="search_course_content",
@@ -97,7 +285,7 @@ def test_handle_tool_execution_calls_tool_manager(ai_generator):
     mock_tool_manager = MagicMock()
     mock_tool_manager.execute_tool.return_value = "search result"
 
-    ai_generator.generate_response("What is Python?", tool_manager=mock_tool_manager)
+    await ai_generator.generate_response("What is Python?", tool_manager=mock_tool_manager)
 
     mock_tool_manager.execute_tool.assert_called_once_with(
         "search_course_content",
@@ -105,7 +293,7 @@ def test_handle_tool_execution_calls_tool_manager(ai_generator):
     )
 
 
-def test_handle_tool_execution_sends_tool_result_back(ai_generator):
+async def test_handle_tool_execution_sends_tool_result_back(ai_generator):
     """The second API call includes a tool_result message block."""
     first = make_tool_use_response(tool_id="tool_xyz")
     second = make_text_response("Final answer")
@@ -114,7 +302,7 @@ def test_handle_tool_execution_sends_tool_result_back(ai_generator):
     mock_tool_manager = MagicMock()
     mock_tool_manager.execute_tool.return_value = "search result content"
 
-    ai_generator.generate_response("Search query", tool_manager=mock_tool_manager)
+    await ai_generator.generate_response("Search query", tool_manager=mock_tool_manager)
 
     assert ai_generator.client.messages.create.call_count == 2
     second_call_kwargs = ai_generator.client.messages.create.call_args_list[1][1]
@@ -133,17 +321,54 @@ def test_handle_tool_execution_sends_tool_result_back(ai_generator):
     assert tool_result_block["content"] == "search result content"
 
 
-def test_no_tool_manager_skips_execution(ai_generator):
+async def test_oversized_tool_results_truncated_before_sending(ai_generator):
+    """Tool output that would overflow the context window is cut down in
+    process instead of being sent for the API to reject."""
+    first = make_tool_use_response(tool_id="tool_big")
+    second = make_text_response("Final answer")
+    ai_generator.client.messages.create.side_effect = [first, second]
+    ai_generator.MAX_CONTEXT_TOKENS = ai_generator.base_params["max_tokens"] + 1000
+
+    mock_tool_manager = MagicMock()
+    mock_tool_manager.execute_tool.return_value = "x" * 10_000
+
+    result = await ai_generator.generate_response("Search query", tool_manager=mock_tool_manager)
+
+    assert result == "Final answer"
+    messages = ai_generator.client.messages.create.call_args_list[1][1]["messages"]
+    content = messages[-1]["content"][0]["content"]
+    assert content.endswith(ai_generator.TRUNCATION_MARKER)
+    assert len(content) < 3500
+
+
+async def test_no_tool_manager_skips_execution(ai_generator):
     """When tool_manager is None, only one API call is made even if stop_reason is
     'tool_use'."""
     ai_generator.client.messages.create.return_value = make_tool_use_response()
 
-    ai_generator.generate_response("Search query", tool_manager=None)
+    result = await ai_generator.generate_response("Search query", tool_manager=None)
+
+    assert ai_generator.client.messages.create.call_count == 1
+    # A tool_use block has no text; the answer is empty rather than an AttributeError
+    assert result == ""
+
+
+async def test_tool_use_without_tool_blocks_returns_text(ai_generator):
+    """A tool_use stop_reason with no actual tool_use blocks returns the text
+    without executing tools or making another API call."""
+    ai_generator.client.messages.create.return_value = make_text_response(
+        "Answer", stop_reason="tool_use"
+    )
+    mock_tool_manager = MagicMock()
+
+    result = await ai_generator.generate_response("query", tool_manager=mock_tool_manager)
 
+    assert result == "Answer"
     assert ai_generator.client.messages.create.call_count == 1
+    mock_tool_manager.execute_tool.assert_not_called()
 
 
-def test_two_sequential_tool_rounds(ai_generator):
+async def test_two_sequential_tool_rounds(ai_generator):
     """Two sequential tool_use responses followed by a text response require 3 API
     calls and 2 tool executions."""
     first = make_tool_use_response(tool_name="get_course_outline", tool_id="t1")
@@ -154,7 +379,7 @@ def test_two_sequential_tool_rounds(ai_generator):
     mock_tool_manager = MagicMock()
     mock_tool_manager.execute_tool.return_value = "some results"
 
-    result = ai_generator.generate_response(
+    result = await ai_generator.generate_response(
         "Multi-step query", tool_manager=mock_tool_manager
     )
 
@@ -163,7 +388,27 @@ def test_two_sequential_tool_rounds(ai_generator):
     assert mock_tool_manager.execute_tool.call_count == 2
 
 
-def test_intermediate_api_call_includes_tools(ai_generator):
+async def test_max_tool_rounds_caps_rounds(ai_generator):
+    """With max_tool_rounds=1 the first follow-up call withholds tools and
+    its answer is final."""
+    first = make_tool_use_response(tool_id="t1")
+    second = make_text_response("Single-round answer")
+    ai_generator.client.messages.create.side_effect = [first, second]
+
+    mock_tool_manager = MagicMock()
+    mock_tool_manager.execute_tool.return_value = "some results"
+
+    result = await ai_generator.generate_response(
+        "Simple query", tools=[{"name": "search_course_content"}],
+        tool_manager=mock_tool_manager, max_tool_rounds=1
+    )
+
+    assert result == "Single-round answer"
+    assert ai_generator.client.messages.create.call_count == 2
+    assert "tools" not in ai_generator.client.messages.create.call_args_list[1][1]
+
+
+async def test_intermediate_api_call_includes_tools(ai_generator):
     """When tools are provided and the loop has not reached the last round, the
     intermediate API call includes the tools parameter."""
     first = make_tool_use_response(tool_id="t1")
@@ -174,16 +419,17 @@ def test_intermediate_api_call_includes_tools(ai_generator):
     mock_tool_manager.execute_tool.return_value = "results"
 
     fake_tools = [{"name": "search_course_content", "description": "search"}]
-    ai_generator.generate_response(
+    await ai_generator.generate_response(
         "query", tools=fake_tools, tool_manager=mock_tool_manager
     )
 
     # The second call (index 1) is the intermediate call and should include tools
     second_call_kwargs = ai_generator.client.messages.create.call_args_list[1][1]
     assert "tools" in second_call_kwargs
+    assert second_call_kwargs["tool_choice"] == {"type": "auto"}
 
 
-def test_final_round_api_call_excludes_tools(ai_generator):
+async def test_final_round_api_call_excludes_tools(ai_generator):
     """When the loop reaches the last round (round_num == MAX_TOOL_ROUNDS - 1), the
     API call must NOT include tools."""
     first = make_tool_use_response(tool_id="t1")
@@ -195,7 +441,7 @@ def test_final_round_api_call_excludes_tools(ai_generator):
     mock_tool_manager.execute_tool.return_value = "results"
 
     fake_tools = [{"name": "search_course_content", "description": "search"}]
-    ai_generator.generate_response(
+    await ai_generator.generate_response(
         "query", tools=fake_tools, tool_manager=mock_tool_manager
     )
 
@@ -204,19 +450,149 @@ def test_final_round_api_call_excludes_tools(ai_generator):
     assert "tools" not in third_call_kwargs
 
 
-def test_tool_failure_terminates_loop(ai_generator):
-    """When a tool is not found, the loop exits early and a fallback API call is
-    made without tools, returning the fallback text."""
+async def test_tool_failure_terminates_loop(ai_generator):
+    """When a tool is not found, the next API call is made without tools and
+    its text is returned; no further calls follow."""
     unknown_tool_response = make_tool_use_response(tool_name="nonexistent", tool_id="t1")
     fallback_text = make_text_response("Fallback answer")
     ai_generator.client.messages.create.side_effect = [unknown_tool_response, fallback_text]
 
     mock_tool_manager = MagicMock()
-    mock_tool_manager.execute_tool.return_value = "Tool 'nonexistent' not found"
+    mock_tool_manager.has_tool.return_value = False
 
-    result = ai_generator.generate_response(
-        "query", tool_manager=mock_tool_manager
+    fake_tools = [{"name": "search_course_content", "description": "search"}]
+    result = await ai_generator.generate_response(
+        "query", tools=fake_tools, tool_manager=mock_tool_manager
     )
 
     assert result == "Fallback answer"
     assert ai_generator.client.messages.create.call_count == 2
+    mock_tool_manager.execute_tool.assert_not_called()
+
+    # The unknown tool is reported back as an error tool_result
+    messages = ai_generator.client.messages.create.call_args_list[1][1]["messages"]
+    tool_result = messages[-1]["content"][0]
+    assert tool_result["tool_use_id"] == "t1"
+    assert tool_result["is_error"] is True
+    assert "tools" not in ai_generator.client.messages.create.call_args_list[1][1]
+
+
+async def test_parallel_tool_calls_keep_block_order(ai_generator):
+    """Multiple tool_use blocks in one round are all executed and their results
+    are sent back in the same order as the blocks, matched by tool_use_id."""
+    first = make_tool_use_response(tool_name="get_course_outline", tool_id="t1")
+    first.content.append(
+        make_tool_use_response(tool_name="search_course_content", tool_id="t2").content[0]
+    )
+    second = make_text_response("Done")
+    ai_generator.client.messages.create.side_effect = [first, second]
+
+    mock_tool_manager = MagicMock()
+    mock_tool_manager.execute_tool.side_effect = lambda name, **kwargs: f"{name} results"
+
+    await ai_generator.generate_response("query", tool_manager=mock_tool_manager)
+
+    assert mock_tool_manager.execute_tool.call_count == 2
+    messages = ai_generator.client.messages.create.call_args_list[1][1]["messages"]
+    tool_results = messages[-1]["content"]
+    assert [r["tool_use_id"] for r in tool_results] == ["t1", "t2"]
+    assert [r["content"] for r in tool_results] == [
+        "get_course_outline results",
+        "search_course_content results",
+    ]
+
+
+async def test_tool_sources_collected_in_block_order(ai_generator):
+    """With a sources list, each call's sources are returned alongside its result
+    and collected in block order, without duplicates."""
+    first = make_tool_use_response(tool_input={"query": "a"}, tool_id="t1")
+    first.content.append(make_tool_use_response(tool_input={"query": "b"}, tool_id="t2").content[0])
+    second = make_text_response("Done")
+    ai_generator.client.messages.create.side_effect = [first, second]
+
+    shared = {"label": "Shared Lesson", "url": None}
+    mock_tool_manager = MagicMock()
+    mock_tool_manager.execute_tool_with_sources.side_effect = lambda name, query: (
+        f"{query} results", [{"label": f"Lesson {query}", "url": None}, shared]
+    )
+    sources = []
+
+    await ai_generator.generate_response(
+        "query", tool_manager=mock_tool_manager, sources=sources
+    )
+
+    mock_tool_manager.execute_tool.assert_not_called()
+    assert sources == [
+        {"label": "Lesson a", "url": None},
+        shared,
+        {"label": "Lesson b", "url": None},
+    ]
+
+
+async def test_stream_yields_text_chunks(ai_generator):
+    """Without tool use, the generated text is streamed chunk by chunk."""
+    ai_generator.client.messages.stream = MagicMock(
+        return_value=FakeStream(make_text_response("Hello world"), ["Hello", " world"])
+    )
+
+    events = await collect(ai_generator.generate_response_stream("query"))
+
+    assert events == text_events("Hello", " world")
+    assert ai_generator.client.messages.stream.call_count == 1
+
+
+async def test_stream_runs_tools_then_streams_final_round(ai_generator):
+    """A tool_use round executes the tools, then the follow-up call is streamed
+    without tools once the last round is reached. Preamble text of the tool
+    rounds is streamed too, each followed by a reset when its tool call starts."""
+    ai_generator.client.messages.stream = MagicMock(side_effect=[
+        FakeStream(make_tool_use_response(tool_id="t1"), ["I'll search ", "the course."]),
+        FakeStream(make_tool_use_response(tool_id="t2"), ["Let me check the outline."]),
+        FakeStream(make_text_response("Done"), ["Do", "ne"]),
+    ])
+    mock_tool_manager = MagicMock()
+    mock_tool_manager.execute_tool.return_value = "results"
+    fake_tools = [{"name": "search_course_content", "description": "search"}]
+
+    events = await collect(ai_generator.generate_response_stream(
+        "query", tools=fake_tools, tool_manager=mock_tool_manager
+    ))
+
+    assert events == [
+        *text_events("I'll search ", "the course."),
+        {"type": "reset"},
+        *text_events("Let me check the outline."),
+        {"type": "reset"},
+        *text_events("Do", "ne"),
+    ]
+    assert mock_tool_manager.execute_tool.call_count == 2
+    calls = ai_generator.client.messages.stream.call_args_list
+    assert "tools" in calls[1][1]
+    assert "tools" not in calls[2][1]
+
+
+async def test_stream_yields_text_chunks_with_tools_available(ai_generator):
+    """A direct answer is streamed chunk by chunk even while tools are offered."""
+    ai_generator.client.messages.stream = MagicMock(
+        return_value=FakeStream(make_text_response("Hello world"), ["Hello", " world"])
+    )
+    fake_tools = [{"name": "search_course_content", "description": "search"}]
+
+    events = await collect(ai_generator.generate_response_stream(
+        "query", tools=fake_tools, tool_manager=MagicMock()
+    ))
+
+    assert events == text_events("Hello", " world")
+
+
+async def test_stream_without_tool_manager_keeps_tool_round_text(ai_generator):
+    """With no tool manager to run the tool call, nothing is reset: the
+    round's text is the answer, as in generate_response."""
+    ai_generator.client.messages.stream = MagicMock(
+        return_value=FakeStream(make_tool_use_response(), ["Let me search."])
+    )
+    fake_tools = [{"name": "search_course_content", "description": "search"}]
+
+    events = await collect(ai_generator.generate_response_stream("query", tools=fake_tools))
+
+    assert events == text_events("Let me search.")
\ No newline at end of file
@@ -1,20 +1,39 @@
 """Tests for the FastAPI HTTP endpoints defined in backend/app.py.
 
-The api_client fixture (conftest.py) imports app.py with external deps mocked:
-  - RAGSystem is replaced by a configurable MagicMock.
+The aclient fixture (conftest.py) is an httpx AsyncClient over an ASGI
+transport to app.py, imported with external deps mocked:
+  - RAGSystem is replaced by a configurable Mock.
   - StaticFiles is replaced by a lightweight stub so a real frontend/ directory
     is not required.
+api_client is the same client with the app's rag_system bound to
+mock_rag_instance, a bare Mock; /api/query tests also take mock_rag_query for
+its canned answer. Tests that never reach an endpoint use aclient directly.
 """
+import json
+
 import pytest
 
+pytestmark = pytest.mark.anyio
+
+# Return values for the mocked RAG system; tuples since the endpoints only iterate
+_LINKED_SOURCES = (
+    {"label": "Python Basics - Lesson 1", "url": "https://example.com/lesson1"},
+)
+_UNLINKED_SOURCES = ({"label": "Unlinkable Lesson", "url": None},)
+_CATALOG_ANALYTICS = {
+    "total_courses": 2,
+    "course_titles": ("Python Basics", "FastAPI Course"),
+}
+_EMPTY_ANALYTICS = {"total_courses": 0, "course_titles": ()}
+
 
 # ---------------------------------------------------------------------------
 # POST /api/query
 # ---------------------------------------------------------------------------
 
-def test_query_success(api_client):
+async def test_query_success(api_client, mock_rag_query):
     """Valid query returns 200 with answer, sources, and session_id."""
-    response = api_client.post(
+    response = await api_client.post(
         "/api/query",
         json={"query": "What is Python?", "session_id": "sess-1"},
     )
@@ -25,44 +44,46 @@ def test_query_success(api_client):
     assert isinstance(body["sources"], list)
 
 
-def test_query_generates_session_when_none_provided(api_client, mock_rag_instance):
+async def test_query_generates_session_when_none_provided(api_client, mock_rag_query):
     """When session_id is omitted, a new session is created and returned."""
-    response = api_client.post("/api/query", json={"query": "What is Python?"})
+    response = await api_client.post("/api/query", json={"query": "What is Python?"})
     assert response.status_code == 200
     assert response.json()["session_id"] == "new-session-123"
-    mock_rag_instance.session_manager.create_session.assert_called_once()
+    mock_rag_query.session_manager.create_session.assert_called_once()
 
 
-def test_query_uses_provided_session_id(api_client, mock_rag_instance):
+async def test_query_uses_provided_session_id(api_client, mock_rag_query):
     """Provided session_id is forwarded to rag_system.query and echoed back."""
-    response = api_client.post(
+    response = await api_client.post(
         "/api/query",
         json={"query": "What is Python?", "session_id": "existing-session"},
     )
     assert response.status_code == 200
     assert response.json()["session_id"] == "existing-session"
-    mock_rag_instance.query.assert_called_once_with(
+    mock_rag_query.query.assert_called_once_with(
         "What is Python?", "existing-session"
     )
+    mock_rag_query.session_manager.create_session.assert_not_called()
 
 
-def test_query_includes_sources(api_client):
-    """Sources returned by rag_system.query are present in the response body."""
-    response = api_client.post(
+@pytest.mark.parametrize("sources", [_LINKED_SOURCES, _UNLINKED_SOURCES, ()],
+                         ids=["linked", "without-url", "none"])
+async def test_query_includes_sources(api_client, mock_rag_query, sources):
+    """Sources returned by rag_system.query are serialized into the response body,
+    with a missing lesson link returned as null."""
+    mock_rag_query.query.return_value = ("Answer", sources)
+    response = await api_client.post(
         "/api/query",
         json={"query": "Tell me about Python", "session_id": "sess-src"},
     )
     assert response.status_code == 200
-    sources = response.json()["sources"]
-    assert len(sources) == 1
-    assert sources[0]["label"] == "Python Basics - Lesson 1"
-    assert sources[0]["url"] == "https://example.com/lesson1"
+    assert response.json()["sources"] == list(sources)
 
 
-def test_query_returns_500_on_rag_error(api_client, mock_rag_instance):
+async def test_query_returns_500_on_rag_error(api_client, mock_rag_query):
     """When rag_system.query raises an exception, the endpoint returns HTTP 500."""
-    mock_rag_instance.query.side_effect = RuntimeError("Something went wrong")
-    response = api_client.post(
+    mock_rag_query.query.side_effect = RuntimeError("Something went wrong")
+    response = await api_client.post(
         "/api/query",
         json={"query": "Bad query", "session_id": "sess-err"},
     )
@@ -70,42 +91,95 @@ def test_query_returns_500_on_rag_error(api_client, mock_rag_instance):
     assert "Something went wrong" in response.json()["detail"]
 
 
-def test_query_rejects_missing_query_field(api_client):
-    """Omitting the required 'query' field returns HTTP 422 (validation error)."""
-    response = api_client.post("/api/query", json={"session_id": "sess-val"})
+@pytest.mark.parametrize("payload", [{"session_id": "sess-val"}, {}],
+                         ids=["missing-query", "empty-body"])
+async def test_query_rejects_missing_query_field(aclient, payload):
+    """Omitting the required 'query' field returns HTTP 422 (validation error).
+
+    Validation rejects the payload before the endpoint runs, so no RAG mock
+    is needed.
+    """
+    response = await aclient.post("/api/query", json=payload)
     assert response.status_code == 422
 
 
 # ---------------------------------------------------------------------------
-# GET /api/courses
+# POST /api/query/stream
 # ---------------------------------------------------------------------------
 
-def test_courses_returns_stats(api_client):
-    """GET /api/courses returns total_courses count and course_titles list."""
-    response = api_client.get("/api/courses")
+def _sse_events(response):
+    """Decode the JSON payloads of a server-sent event response body."""
+    return [
+        json.loads(line[len("data: "):])
+        for line in response.text.split("\n\n")
+        if line.startswith("data: ")
+    ]
+
+
+async def test_query_stream_emits_text_sources_and_done(api_client, mock_rag_instance):
+    """The stream endpoint relays RAG events and finishes with the session id."""
+    async def fake_stream(query, session_id):
+        yield {"type": "text", "text": "Python is "}
+        yield {"type": "text", "text": "a language."}
+        yield {"type": "sources", "sources": []}
+
+    mock_rag_instance.query_stream = fake_stream
+    response = await api_client.post(
+        "/api/query/stream",
+        json={"query": "What is Python?", "session_id": "sess-stream"},
+    )
     assert response.status_code == 200
-    body = response.json()
-    assert body["total_courses"] == 2
-    assert body["course_titles"] == ["Python Basics", "FastAPI Course"]
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert _sse_events(response) == [
+        {"type": "text", "text": "Python is "},
+        {"type": "text", "text": "a language."},
+        {"type": "sources", "sources": []},
+        {"type": "done", "session_id": "sess-stream"},
+    ]
+
+
+async def test_query_stream_reports_errors_as_events(api_client, mock_rag_instance):
+    """A failure mid-stream is reported as an error event rather than a 500."""
+    async def failing_stream(query, session_id):
+        raise RuntimeError("Something went wrong")
+        yield
+
+    mock_rag_instance.query_stream = failing_stream
+    response = await api_client.post("/api/query/stream", json={"query": "Bad query"})
+    assert response.status_code == 200
+    assert _sse_events(response) == [{"type": "error", "detail": "Something went wrong"}]
 
 
-def test_courses_returns_empty_list_when_no_courses(api_client, mock_rag_instance):
-    """When there are no courses, total_courses is 0 and course_titles is []."""
-    mock_rag_instance.get_course_analytics.return_value = {
-        "total_courses": 0,
-        "course_titles": [],
-    }
-    response = api_client.get("/api/courses")
+async def test_query_stream_returns_500_on_session_error(api_client, mock_rag_instance):
+    """A failure to create the session happens before streaming starts, so the
+    endpoint returns HTTP 500."""
+    mock_rag_instance.session_manager.create_session.side_effect = RuntimeError("No sessions")
+    response = await api_client.post("/api/query/stream", json={"query": "What is Python?"})
+    assert response.status_code == 500
+    assert response.json()["detail"] == "No sessions"
+
+
+# ---------------------------------------------------------------------------
+# GET /api/courses
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize("analytics", [_CATALOG_ANALYTICS, _EMPTY_ANALYTICS],
+                         ids=["catalog", "empty"])
+async def test_courses_returns_stats(api_client, mock_rag_instance, analytics):
+    """GET /api/courses returns total_courses count and course_titles list,
+    including an empty catalog."""
+    mock_rag_instance.get_course_analytics.return_value = analytics
+    response = await api_client.get("/api/courses")
     assert response.status_code == 200
     body = response.json()
-    assert body["total_courses"] == 0
-    assert body["course_titles"] == []
+    assert body["total_courses"] == analytics["total_courses"]
+    assert body["course_titles"] == list(analytics["course_titles"])
 
 
-def test_courses_returns_500_on_analytics_error(api_client, mock_rag_instance):
+async def test_courses_returns_500_on_analytics_error(api_client, mock_rag_instance):
     """When get_course_analytics raises an exception, the endpoint returns HTTP 500."""
     mock_rag_instance.get_course_analytics.side_effect = RuntimeError("DB error")
-    response = api_client.get("/api/courses")
+    response = await api_client.get("/api/courses")
     assert response.status_code == 500
     assert "DB error" in response.json()["detail"]
 
@@ -114,9 +188,9 @@ def test_courses_returns_500_on_analytics_error(api_client, mock_rag_instance):
 # DELETE /api/session/{session_id}
 # ---------------------------------------------------------------------------
 
-def test_clear_session_returns_cleared_status(api_client, mock_rag_instance):
+async def test_clear_session_returns_cleared_status(api_client, mock_rag_instance):
     """DELETE /api/session/{id} clears the session and returns {"status": "cleared"}."""
-    response = api_client.delete("/api/session/test-session-id")
+    response = await api_client.delete("/api/session/test-session-id")
     assert response.status_code == 200
     assert response.json() == {"status": "cleared"}
     mock_rag_instance.session_manager.clear_session.assert_called_once_with(
@@ -128,7 +202,7 @@ def test_clear_session_returns_cleared_status(api_client, mock_rag_instance):
 # GET / (static frontend served by mounted DevStaticFiles)
 # ---------------------------------------------------------------------------
 
-def test_root_serves_frontend(api_client):
+async def test_root_serves_frontend(api_client):
     """The root path is handled by the mounted static-file app and returns 200."""
-    response = api_client.get("/")
+    response = await api_client.get("/")
     assert response.status_code == 200
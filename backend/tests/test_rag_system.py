@@ -1,45 +1,189 @@
+from types import SimpleNamespace
+
+import anyio
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import Mock
 
+from ai_generator import AIGenerator
 from rag_system import RAGSystem
+from search_tools import CourseSearchTool, ToolManager
+from vector_store import SearchResults
+
+pytestmark = pytest.mark.anyio
+
+
+# ---------------------------------------------------------------------------
+# Fakes
+# ---------------------------------------------------------------------------
+
+class FakeToolManager:
+    """The slice of ToolManager that RAGSystem.query() uses."""
+
+    def __init__(self):
+        self.defs = [{"name": "search_course_content"}]
+
+    def get_tool_definitions(self):
+        return self.defs
+
+
+class FakeAIGenerator:
+    """Spy standing in for AIGenerator: returns `response` (or streams
+    `events`), reports `sources` into the caller's list, raises `error` if
+    set, and records the kwargs of every call."""
+
+    def __init__(self):
+        self.response = "Answer"
+        self.events = []
+        self.sources = []
+        self.error = None
+        self.calls = []
+
+    async def generate_response(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.error:
+            raise self.error
+        kwargs["sources"].extend(self.sources)
+        return self.response
+
+    async def generate_response_stream(self, **kwargs):
+        self.calls.append(kwargs)
+        for event in self.events:
+            yield event
+        kwargs["sources"].extend(self.sources)
+
+
+class _TopicClient:
+    """Fake Anthropic client: searches for the last word of the question, then
+    answers about it once the tool result is back.
+
+    Answers about "alpha" are held back briefly, so a concurrent query runs
+    its search and finishes between an alpha query's search and its answer.
+    """
+
+    def __init__(self):
+        self.messages = self
+
+    async def create(self, **params):
+        await self._delay(params["messages"])
+        return self._respond(params["messages"])
+
+    def stream(self, **params):
+        return _FinishedStream(self._respond(params["messages"]), self._delay(params["messages"]))
+
+    @staticmethod
+    async def _delay(messages):
+        held_back = len(messages) > 1 and messages[0]["content"].endswith("alpha")
+        await anyio.sleep(0.05 if held_back else 0)
+
+    @staticmethod
+    def _respond(messages):
+        topic = messages[0]["content"].split()[-1]
+        if len(messages) == 1:
+            block = SimpleNamespace(type="tool_use", name="search_course_content",
+                                    id="t1", input={"query": topic})
+            return SimpleNamespace(stop_reason="tool_use", content=[block])
+        block = SimpleNamespace(type="text", text=f"About {topic}")
+        return SimpleNamespace(stop_reason="end_turn", content=[block])
+
+
+class _FinishedStream:
+    """Message stream over an already complete response, opened after `delay`."""
+
+    def __init__(self, response, delay):
+        self.response = response
+        self.delay = delay
+
+    async def __aenter__(self):
+        await self.delay
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for block in self.response.content:
+            await anyio.sleep(0)
+            if block.type == "text":
+                yield SimpleNamespace(type="text", text=block.text)
+            else:
+                yield SimpleNamespace(type="content_block_start", content_block=block)
+
+    async def get_final_message(self):
+        return self.response
+
+
+class _TopicStore:
+    """Vector store whose only hit for a search is a lesson named after the query."""
+
+    def search(self, *, query, course_name=None, lesson_number=None):
+        return SearchResults(
+            documents=(f"Notes on {query}",),
+            metadata=({"course_title": query, "lesson_number": 1},),
+            distances=(0.1,)
+        )
+
+    def get_lesson_link(self, course_title, lesson_number):
+        return f"https://example.com/{course_title}"
 
 
 # ---------------------------------------------------------------------------
 # Fixtures
 # ---------------------------------------------------------------------------
 
+@pytest.fixture(scope="module", autouse=True)
+def _patched_dependencies():
+    """Replace RAGSystem's dependencies once for the whole module.
+
+    Each construction still gets fresh Mock instances, so call records
+    don't leak between tests. AIGenerator is stubbed too, so no Anthropic
+    client or connection pool is built for an instance the rag fixture
+    replaces anyway.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        for name in ("VectorStore", "AIGenerator", "SessionManager", "DocumentProcessor"):
+            mp.setattr(f"rag_system.{name}", lambda *args: Mock())
+        yield
+
+
 @pytest.fixture
 def rag(mock_config):
-    """RAGSystem with all external dependencies patched out.
+    """RAGSystem with its storage dependencies patched out and its generator
+    and tool manager replaced by fakes.
 
-    After construction, tool_manager is replaced with a full MagicMock so
-    individual tests can control its behaviour without triggering real tool
-    execution (including the deliberate ZeroDivisionError in CourseSearchTool).
+    The fake tool manager also keeps tests clear of real tool execution
+    (including the deliberate ZeroDivisionError in CourseSearchTool).
     """
-    with patch("rag_system.VectorStore"), \
-         patch("rag_system.AIGenerator"), \
-         patch("rag_system.SessionManager"), \
-         patch("rag_system.DocumentProcessor"):
-        system = RAGSystem(mock_config)
-
-    # Replace tool_manager with a controllable mock
-    mock_tm = MagicMock()
-    mock_tm.get_tool_definitions.return_value = [{"name": "search_course_content"}]
-    mock_tm.get_last_sources.return_value = []
-    system.tool_manager = mock_tm
+    system = RAGSystem(mock_config)
 
+    system.ai_generator = FakeAIGenerator()
+    system.tool_manager = FakeToolManager()
     return system
 
 
+@pytest.fixture
+def live_rag(rag, monkeypatch):
+    """rag running a real AIGenerator and ToolManager, over a fake API client
+    and vector store."""
+    monkeypatch.setattr("ai_generator._get_client", lambda api_key: _TopicClient())
+    rag.ai_generator = AIGenerator("test_key", "test-model")
+    rag.tool_manager = ToolManager()
+    rag.tool_manager.register_tool(CourseSearchTool(_TopicStore()))
+    return rag
+
+
+def _topic_source(topic):
+    return {"label": f"{topic} - Lesson 1", "url": f"https://example.com/{topic}"}
+
+
 # ---------------------------------------------------------------------------
 # Tests
 # ---------------------------------------------------------------------------
 
-def test_query_returns_response_and_sources(rag):
+async def test_query_returns_response_and_sources(rag):
     """query() returns a (str, list) tuple."""
-    rag.ai_generator.generate_response.return_value = "Test response"
+    rag.ai_generator.response = "Test response"
 
-    result = rag.query("What is Python?")
+    result = await rag.query("What is Python?")
 
     assert isinstance(result, tuple)
     assert len(result) == 2
@@ -47,57 +191,137 @@ def test_query_returns_response_and_sources(rag):
     assert isinstance(result[1], list)
 
 
-def test_query_propagates_to_ai_generator(rag):
+async def test_query_propagates_to_ai_generator(rag):
     """ai_generator.generate_response is called and the user query is in the prompt."""
-    rag.ai_generator.generate_response.return_value = "Answer"
+    await rag.query("What is machine learning?")
 
-    rag.query("What is machine learning?")
-
-    call_args = rag.ai_generator.generate_response.call_args
     # The prompt wraps the original query; ensure the content is forwarded
-    assert call_args is not None
-    query_arg = call_args[1].get("query") or call_args[0][0]
-    assert "machine learning" in query_arg
+    assert len(rag.ai_generator.calls) == 1
+    assert "machine learning" in rag.ai_generator.calls[-1]["query"]
 
 
-def test_query_tools_passed_to_generator(rag):
+async def test_query_tools_passed_to_generator(rag):
     """Tool definitions from tool_manager are forwarded into the generator call."""
     tool_defs = [{"name": "search_course_content"}, {"name": "get_course_outline"}]
-    rag.tool_manager.get_tool_definitions.return_value = tool_defs
-    rag.ai_generator.generate_response.return_value = "Answer"
+    rag.tool_manager.defs = tool_defs
+
+    await rag.query("What is Python?")
 
-    rag.query("What is Python?")
+    assert rag.ai_generator.calls[-1]["tools"] == tool_defs
 
-    call_kwargs = rag.ai_generator.generate_response.call_args[1]
-    assert call_kwargs["tools"] == tool_defs
 
+async def test_short_query_limited_to_one_tool_round(rag):
+    """A short single-step question is given one tool round."""
+    await rag.query("What is Python?")
 
-def test_query_sources_retrieved_and_reset(rag):
-    """get_last_sources() and reset_sources() are both called on tool_manager."""
-    rag.ai_generator.generate_response.return_value = "Answer"
-    rag.tool_manager.get_last_sources.return_value = [
+    assert rag.ai_generator.calls[-1]["max_tool_rounds"] == 1
+
+
+@pytest.mark.parametrize("query", [
+    "Compare lesson 1 of the Python course with lesson 2",
+    "MCP and RAG?",
+])
+async def test_complex_query_keeps_configured_tool_rounds(rag, query):
+    """Long questions, or ones naming several steps, keep MAX_TOOL_ROUNDS."""
+    await rag.query(query)
+
+    assert rag.ai_generator.calls[-1]["max_tool_rounds"] == 2
+
+
+async def test_query_returns_sources_collected_by_generator(rag):
+    """query() returns the sources the generator collected for this query."""
+    rag.ai_generator.sources = [
         {"label": "Python Course", "url": "https://example.com"}
     ]
 
-    rag.query("Test query")
+    _, sources = await rag.query("Test query")
+
+    assert sources == [{"label": "Python Course", "url": "https://example.com"}]
+
+
+async def test_concurrent_queries_keep_their_own_sources(live_rag):
+    """Queries interleaving on the event loop each get the sources of their own
+    searches, not whichever search finished last."""
+    results = {}
+
+    async def ask(topic):
+        results[topic] = await live_rag.query(f"Tell me about {topic}")
 
-    rag.tool_manager.get_last_sources.assert_called_once()
-    rag.tool_manager.reset_sources.assert_called_once()
+    async with anyio.create_task_group() as tg:
+        for topic in ("alpha", "beta"):
+            tg.start_soon(ask, topic)
 
+    assert results == {
+        "alpha": ("About alpha", [_topic_source("alpha")]),
+        "beta": ("About beta", [_topic_source("beta")]),
+    }
 
-def test_query_session_history_used(rag):
+
+async def test_query_session_history_used(rag):
     """If session_id is provided, get_conversation_history is called with it."""
-    rag.ai_generator.generate_response.return_value = "Answer"
     rag.session_manager.get_conversation_history.return_value = "Previous conversation"
 
-    rag.query("Test query", session_id="session_123")
+    await rag.query("Test query", session_id="session_123")
 
     rag.session_manager.get_conversation_history.assert_called_once_with("session_123")
+    assert rag.ai_generator.calls[-1]["conversation_history"] == "Previous conversation"
 
 
-def test_query_exception_raises_correctly(rag):
+async def test_query_exception_raises_correctly(rag):
     """If ai_generator raises, the exception propagates out of query()."""
-    rag.ai_generator.generate_response.side_effect = RuntimeError("API error")
+    rag.ai_generator.error = RuntimeError("API error")
 
     with pytest.raises(RuntimeError, match="API error"):
-        rag.query("Test query")
+        await rag.query("Test query")
+
+
+async def test_query_stream_yields_text_then_sources(rag):
+    """query_stream() forwards text chunks, then emits sources and records the
+    full answer in the session history."""
+    rag.ai_generator.events = [
+        {"type": "text", "text": "Python "},
+        {"type": "text", "text": "is great"},
+    ]
+    rag.ai_generator.sources = [{"label": "Python Course", "url": None}]
+
+    events = [event async for event in rag.query_stream("What is Python?", session_id="s1")]
+
+    assert events == [
+        {"type": "text", "text": "Python "},
+        {"type": "text", "text": "is great"},
+        {"type": "sources", "sources": [{"label": "Python Course", "url": None}]},
+    ]
+    rag.session_manager.add_exchange.assert_called_once_with("s1", "What is Python?", "Python is great")
+
+
+async def test_query_stream_keeps_only_text_after_reset_in_history(rag):
+    """A reset event is forwarded and drops the preamble before it from the
+    answer recorded in the session history."""
+    rag.ai_generator.events = [
+        {"type": "text", "text": "Let me search."},
+        {"type": "reset"},
+        {"type": "text", "text": "Python is great"},
+    ]
+
+    events = [event async for event in rag.query_stream("What is Python?", session_id="s1")]
+
+    assert events[:3] == rag.ai_generator.events
+    rag.session_manager.add_exchange.assert_called_once_with("s1", "What is Python?", "Python is great")
+
+
+async def test_concurrent_query_streams_keep_their_own_sources(live_rag):
+    """Interleaved query_stream() calls each end with their own sources."""
+    events = {}
+
+    async def ask(topic):
+        events[topic] = [event async for event in live_rag.query_stream(f"Tell me about {topic}")]
+
+    async with anyio.create_task_group() as tg:
+        for topic in ("alpha", "beta"):
+            tg.start_soon(ask, topic)
+
+    for topic in ("alpha", "beta"):
+        assert events[topic] == [
+            {"type": "text", "text": f"About {topic}"},
+            {"type": "sources", "sources": [_topic_source(topic)]},
+        ]
\ No newline at end of file
@@ -1,87 +1,82 @@
-import pytest
-from unittest.mock import MagicMock
-
-from search_tools import CourseSearchTool, ToolManager
-from vector_store import SearchResults
+from search_tools import CourseOutlineTool, ToolManager
 
 
 # ---------------------------------------------------------------------------
 # CourseSearchTool tests
 # ---------------------------------------------------------------------------
 
-def test_execute_does_not_raise_zero_division(mock_vector_store, sample_search_results):
+def test_execute_does_not_raise_zero_division(search_tool):
     """Verifies the ZeroDivisionError bug has been removed from execute()."""
-    mock_vector_store.search.return_value = sample_search_results
-    mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
-
-    tool = CourseSearchTool(mock_vector_store)
     # Should not raise ZeroDivisionError after the fix
-    result = tool.execute(query="test query")
+    result = search_tool.execute(query="test query")
     assert result is not None
 
 
-def test_execute_returns_formatted_results(mock_vector_store, sample_search_results):
+def test_execute_returns_formatted_results(search_tool):
     """After fix: execute returns a formatted string containing the course title."""
-    mock_vector_store.search.return_value = sample_search_results
-    mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
-
-    tool = CourseSearchTool(mock_vector_store)
-    result = tool.execute(query="test query")
+    result = search_tool.execute(query="test query")
 
     assert "[Python Course" in result
 
 
-def test_execute_no_results_returns_message(mock_vector_store, empty_search_results):
+def test_execute_no_results_returns_message(search_tool, fake_vector_store, empty_search_results):
     """After fix: empty results return a 'No relevant content found.' message."""
-    mock_vector_store.search.return_value = empty_search_results
+    fake_vector_store.results = empty_search_results
 
-    tool = CourseSearchTool(mock_vector_store)
-    result = tool.execute(query="test query")
+    result = search_tool.execute(query="test query")
 
     assert "No relevant content found" in result
 
 
-def test_execute_tracks_last_sources(mock_vector_store, sample_search_results):
+def test_execute_tracks_last_sources(search_tool):
     """After fix: last_sources is populated after a successful search."""
-    mock_vector_store.search.return_value = sample_search_results
-    mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
+    search_tool.execute(query="test query")
 
-    tool = CourseSearchTool(mock_vector_store)
-    tool.execute(query="test query")
+    assert len(search_tool.last_sources) > 0
 
-    assert len(tool.last_sources) > 0
 
-
-def test_execute_with_course_filter(mock_vector_store, sample_search_results):
+def test_execute_with_course_filter(search_tool, fake_vector_store):
     """After fix: course_name is forwarded to store.search() as a keyword argument."""
-    mock_vector_store.search.return_value = sample_search_results
+    search_tool.execute(query="test query", course_name="Python Course")
 
-    tool = CourseSearchTool(mock_vector_store)
-    tool.execute(query="test query", course_name="Python Course")
+    assert fake_vector_store.search_calls == [
+        {"query": "test query", "course_name": "Python Course", "lesson_number": None}
+    ]
 
-    mock_vector_store.search.assert_called_once_with(
-        query="test query",
-        course_name="Python Course",
-        lesson_number=None
-    )
+
+def test_execute_with_sources_leaves_last_sources_alone(search_tool):
+    """execute_with_sources() returns its sources instead of storing them."""
+    result, sources = search_tool.execute_with_sources(query="test query")
+
+    assert "[Python Course" in result
+    assert sources == [{"label": "Python Course - Lesson 1", "url": "https://example.com/lesson1"}]
+    assert search_tool.last_sources == []
 
 
 # ---------------------------------------------------------------------------
 # ToolManager tests
 # ---------------------------------------------------------------------------
 
-def test_tool_manager_dispatches_correctly(mock_vector_store, sample_search_results):
+def test_tool_manager_dispatches_correctly(tool_manager):
     """After fix: ToolManager.execute_tool dispatches to the correct registered tool."""
-    mock_vector_store.search.return_value = sample_search_results
-    mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
+    result = tool_manager.execute_tool("search_course_content", query="test query")
 
-    manager = ToolManager()
-    tool = CourseSearchTool(mock_vector_store)
-    manager.register_tool(tool)
+    assert "[Python Course" in result
 
-    result = manager.execute_tool("search_course_content", query="test query")
 
-    assert "[Python Course" in result
+def test_tool_manager_returns_sources_per_call(tool_manager, fake_vector_store):
+    """execute_tool_with_sources() returns the call's sources; tools that don't
+    track sources report none."""
+    tool_manager.register_tool(CourseOutlineTool(fake_vector_store))
+
+    _, sources = tool_manager.execute_tool_with_sources("search_course_content", query="test query")
+    _, outline_sources = tool_manager.execute_tool_with_sources(
+        "get_course_outline", course_title="Python Course"
+    )
+
+    assert len(sources) == 1
+    assert outline_sources == []
+    assert tool_manager.get_last_sources() == []
 
 
 def test_tool_manager_unknown_tool():
@@ -92,16 +87,25 @@ def test_tool_manager_unknown_tool():
     assert "Tool 'nonexistent_tool' not found" in result
 
 
-def test_get_last_sources_returns_sources(mock_vector_store, sample_search_results):
-    """After fix: ToolManager.get_last_sources() returns non-empty list after a search."""
-    mock_vector_store.search.return_value = sample_search_results
-    mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
+def test_tool_manager_has_tool(tool_manager):
+    """has_tool() reports only registered tool names."""
+    assert tool_manager.has_tool("search_course_content")
+    assert not tool_manager.has_tool("nonexistent_tool")
 
-    manager = ToolManager()
-    tool = CourseSearchTool(mock_vector_store)
-    manager.register_tool(tool)
 
-    manager.execute_tool("search_course_content", query="test query")
-    sources = manager.get_last_sources()
+def test_tool_definitions_built_once_until_registration(tool_manager, fake_vector_store):
+    """get_tool_definitions() reuses its list until another tool is registered."""
+    first = tool_manager.get_tool_definitions()
+    assert tool_manager.get_tool_definitions() is first
+
+    tool_manager.register_tool(CourseOutlineTool(fake_vector_store))
+    names = [d["name"] for d in tool_manager.get_tool_definitions()]
+    assert names == ["search_course_content", "get_course_outline"]
+
+
+def test_get_last_sources_returns_sources(tool_manager):
+    """After fix: ToolManager.get_last_sources() returns non-empty list after a search."""
+    tool_manager.execute_tool("search_course_content", query="test query")
+    sources = tool_manager.get_last_sources()
 
     assert len(sources) > 0
@@ -89,8 +89,9 @@ async function sendMessage() {
     chatMessages.appendChild(loadingMessage);
     chatMessages.scrollTop = chatMessages.scrollHeight;
 
+    let answerDiv = null;
     try {
-        const response = await fetch(`${API_URL}/query`, {
+        const response = await fetch(`${API_URL}/query/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -103,20 +104,40 @@ async function sendMessage() {
 
         if (!response.ok) throw new Error('Query failed');
 
-        const data = await response.json();
-        
-        // Update session ID if new
-        if (!currentSessionId) {
-            currentSessionId = data.session_id;
-        }
+        // Render the answer as it streams in; sources arrive after the text
+        let answer = '';
+        let sources = null;
+        await readEventStream(response, (event) => {
+            if (event.type === 'text') {
+                answer += event.text;
+            } else if (event.type === 'reset') {
+                // The text so far was a preamble to a tool call; the answer follows
+                answer = '';
+            } else if (event.type === 'sources') {
+                sources = event.sources;
+            } else if (event.type === 'done') {
+                // Update session ID if new
+                if (!currentSessionId) {
+                    currentSessionId = event.session_id;
+                }
+            } else if (event.type === 'error') {
+                throw new Error(event.detail);
+            }
 
-        // Replace loading message with response
-        loadingMessage.remove();
-        addMessage(data.answer, 'assistant', data.sources);
+            if (!answerDiv) {
+                // Replace loading message with the response as soon as text arrives
+                loadingMessage.remove();
+                addMessage('', 'assistant');
+                answerDiv = chatMessages.lastElementChild;
+            }
+            answerDiv.innerHTML = renderMessage(answer, 'assistant', sources);
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        });
 
     } catch (error) {
-        // Replace loading message with error
+        // Replace loading message (or partial answer) with error
         loadingMessage.remove();
+        if (answerDiv) answerDiv.remove();
         addMessage(`Error: ${error.message}`, 'assistant');
     } finally {
         chatInput.disabled = false;
@@ -140,12 +161,36 @@ function createLoadingMessage() {
     return messageDiv;
 }
 
+// Parse a server-sent event stream, calling onEvent for each JSON `data:` payload
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const event of events) {
+            if (event.startsWith('data: ')) onEvent(JSON.parse(event.slice(6)));
+        }
+    }
+}
+
 function addMessage(content, type, sources = null, isWelcome = false) {
     const messageId = Date.now();
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${type}${isWelcome ? ' welcome-message' : ''}`;
     messageDiv.id = `message-${messageId}`;
+    messageDiv.innerHTML = renderMessage(content, type, sources);
+    chatMessages.appendChild(messageDiv);
+    chatMessages.scrollTop = chatMessages.scrollHeight;
     
+    return messageId;
+}
+
+function renderMessage(content, type, sources = null) {
     // Convert markdown to HTML for assistant messages
     const displayContent = type === 'assistant' ? marked.parse(content) : escapeHtml(content);
     
@@ -165,11 +210,7 @@ function addMessage(content, type, sources = null, isWelcome = false) {
         `;
     }
     
-    messageDiv.innerHTML = html;
-    chatMessages.appendChild(messageDiv);
-    chatMessages.scrollTop = chatMessages.scrollHeight;
-    
-    return messageId;
+    return html;
 }
 
 // Helper function to escape HTML for user messages